@@ -0,0 +1,145 @@
+import asyncio
+import logging
+import time
+from typing import Any, Callable, List, Optional, Tuple
+
+from sqlalchemy.exc import DataError, IntegrityError
+
+logger = logging.getLogger(__name__)
+
+# Errors caused by the rows themselves; retrying them unchanged can never succeed.
+ROW_ERRORS = (IntegrityError, DataError)
+
+
+class BatchWriter:
+    """
+    Collect rows queued by request handlers and write them in one statement per batch.
+    A batch is flushed when batch_size items are pending or every interval seconds.
+
+    The pending list is only touched on the event loop thread, so it needs no locking; the blocking
+    database write itself runs in a worker thread so a large flush never stalls other requests.
+    When the database is unavailable the whole batch is put back and retried with exponential backoff
+    (up to max_backoff seconds apart); rows are only given up on, with an error log carrying the row,
+    once they have kept failing for retry_for seconds.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        flush_fn: Callable[[List[Any]], None],
+        batch_size: int = 500,
+        interval: float = 0.25,
+        retry_for: float = 600.0,
+        max_backoff: float = 30.0,
+    ):
+        self.name = name
+        self.batch_size = batch_size
+        self.interval = interval
+        self.retry_for = retry_for
+        self.max_backoff = max_backoff
+        self._flush_fn = flush_fn
+        # (item, monotonic time of its first failed write, or None)
+        self._pending: List[Tuple[Any, Optional[float]]] = []
+        self._backoff = 0.0
+        self._retry_at = 0.0
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._stopping = False
+        self._task: Optional[asyncio.Task] = None
+
+    def put(self, item: Any) -> None:
+        self._pending.append((item, None))
+        if len(self._pending) >= self.batch_size:
+            # Let the background loop flush now rather than writing on the caller's turn of the loop.
+            self._wakeup.set()
+
+    def _write(self, entries: List[Tuple[Any, Optional[float]]]) -> List[Tuple[Any, Optional[float]]]:
+        """
+        Runs in a worker thread. Returns the entries to retry later. Only a data/integrity error is
+        blamed on individual rows: the batch is then retried row by row and the offending rows dropped.
+        Anything else (database unreachable, disconnects) puts the whole batch back untouched.
+        """
+        try:
+            self._flush_fn([item for item, _ in entries])
+            return []
+        except ROW_ERRORS:
+            if len(entries) == 1:
+                logger.exception("Dropping %s row that failed to write: %r", self.name, entries[0][0])
+                return []
+            logger.exception("Failed to flush %d %s rows; retrying row by row", len(entries), self.name)
+        except Exception:
+            logger.exception("Failed to flush %d %s rows; will retry", len(entries), self.name)
+            return entries
+        # One bad row fails the whole executemany; write the rest individually so only it is lost.
+        for i, entry in enumerate(entries):
+            try:
+                self._flush_fn([entry[0]])
+            except ROW_ERRORS:
+                logger.exception("Dropping %s row that failed to write: %r", self.name, entry[0])
+            except Exception:
+                logger.exception("Failed to write %s rows; will retry", self.name)
+                return entries[i:]
+        return []
+
+    async def flush(self, force: bool = False) -> None:
+        """
+        Write everything pending now, in a worker thread. Flushes are serialized, so awaiting this also
+        waits for a flush already in progress. While backing off after a failed write this returns
+        without touching the database, unless force is set.
+        """
+        async with self._flush_lock:
+            if not self._pending or (not force and time.monotonic() < self._retry_at):
+                return
+            entries, self._pending = self._pending, []
+            failed = await asyncio.to_thread(self._write, entries)
+            if not failed:
+                self._backoff = 0.0
+                self._retry_at = 0.0
+                return
+            now = time.monotonic()
+            retry = []
+            for item, first_failed in failed:
+                if first_failed is None:
+                    first_failed = now
+                if now - first_failed >= self.retry_for:
+                    logger.error(
+                        "Dropping %s row after %.0fs of failed writes: %r", self.name, now - first_failed, item
+                    )
+                else:
+                    retry.append((item, first_failed))
+            self._pending[:0] = retry
+            self._backoff = min(self.max_backoff, self._backoff * 2 or self.interval)
+            self._retry_at = now + self._backoff
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("%s flush loop error", self.name)
+
+    def start(self) -> None:
+        if self._task is None:
+            # Loop primitives are created here so they belong to the loop the app actually runs on.
+            self._wakeup = asyncio.Event()
+            self._flush_lock = asyncio.Lock()
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the periodic flusher and write whatever is still pending."""
+        if self._task is not None:
+            # Not cancelled: a cancelled await would abandon rows whose write is still running in its thread.
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush(force=True)
+        for item, _ in self._pending:
+            logger.error("Dropping unwritten %s row at shutdown: %r", self.name, item)
+        self._pending = []
@@ -1,7 +1,8 @@
+import itertools
 import random
 import string
 import uuid
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, ForeignKey, Text, Index
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
 
@@ -29,13 +30,20 @@ class App(Base):
 
 
 def generate_account_number(db_session) -> str:
-    """Generate unique 3-letter account number (a-z). Retries on collision."""
+    """Generate unique 3-letter account number (a-z). Retries on collision.
+
+    Existing account numbers are loaded once into a set so collisions are checked in memory.
+    """
+    taken = {row[0] for row in db_session.query(App.account_number)}
     max_retries = 100
     for _ in range(max_retries):
         code = "".join(random.choices(string.ascii_lowercase, k=3))
-        exists = db_session.query(App).filter(App.account_number == code).first()
-        if not exists:
+        if code not in taken:
             return code
+    # Code space is dense: pick uniformly from whatever is still free.
+    free = [code for code in map("".join, itertools.product(string.ascii_lowercase, repeat=3)) if code not in taken]
+    if free:
+        return random.choice(free)
     raise ValueError("Could not generate unique account number")
 
 
@@ -61,6 +69,9 @@ class Credential(Base):
 
 class StkPushTransaction(Base):
     __tablename__ = "stk_push_transactionss"
+    __table_args__ = (
+        Index("ix_stkpush_mid_cid", "merchant_request_id", "checkout_request_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     credential_id = Column(Integer, ForeignKey("credentials.id"), nullable=False, index=True)
@@ -78,6 +89,10 @@ class StkPushTransaction(Base):
 
 class Transaction(Base):
     __tablename__ = "paybill_offline"
+    __table_args__ = (
+        Index("ix_paybill_credref", "credential_id", "account_reference"),
+        Index("ix_paybill_txnno", "transaction_number"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     credential_id = Column(Integer, ForeignKey("credentials.id"), nullable=False, index=True)
@@ -1,7 +1,25 @@
+import os
 from cryptography.hazmat.primitives import serialization
 from cryptography.hazmat.primitives.asymmetric import padding
+from cryptography.hazmat.primitives.asymmetric.rsa import RSAPublicKey
 import base64
 
+# Parsed public keys keyed by path -> (mtime, key) so repeated calls skip disk I/O and PEM parsing.
+# One entry per path: an edited file replaces its entry instead of adding another.
+_KEY_CACHE: dict[str, tuple[float, RSAPublicKey]] = {}
+
+
+def _load_public_key(public_key_path: str) -> RSAPublicKey:
+    """Return the parsed public key at public_key_path, reloading it when the file changes."""
+    mtime = os.stat(public_key_path).st_mtime
+    cached = _KEY_CACHE.get(public_key_path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    with open(public_key_path, "rb") as f:
+        public_key = serialization.load_pem_public_key(f.read())
+    _KEY_CACHE[public_key_path] = (mtime, public_key)
+    return public_key
+
 
 def generate_security_credentials(password: str, public_key_path: str) -> str:
     """
@@ -16,8 +34,7 @@ def generate_security_credentials(password: str, public_key_path: str) -> str:
         str: Base64-encoded security credentials for the security_credential field.
     """
     try:
-        with open(public_key_path, "rb") as f:
-            public_key = serialization.load_pem_public_key(f.read())
+        public_key = _load_public_key(public_key_path)
         encrypted = public_key.encrypt(password.encode("utf-8"), padding.PKCS1v15())
         return base64.b64encode(encrypted).decode("utf-8")
     except Exception as e:
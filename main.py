@@ -1,22 +1,40 @@
+import asyncio
+import atexit
 import logging
+import queue
 import sys
-import requests
-import pytz
+import threading
+import time
+import httpx
+import orjson
 from datetime import datetime
+from zoneinfo import ZoneInfo
+from collections import OrderedDict
+from logging.handlers import QueueHandler, QueueListener
+from types import SimpleNamespace
 from typing import Dict, List, Optional
 
 logger = logging.getLogger(__name__)
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    stream=sys.stdout,
-)
-
+# Request threads only enqueue log records; a listener thread does the stdout I/O.
+_log_handler = logging.StreamHandler(sys.stdout)
+_log_handler.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+_log_queue: queue.Queue = queue.Queue(-1)
+_log_listener = QueueListener(_log_queue, _log_handler)
+_queue_handler = QueueHandler(_log_queue)
+_queue_handler.setFormatter(logging.Formatter("%(message)s"))
+logging.basicConfig(level=logging.INFO, handlers=[_queue_handler], force=True)
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
+from cachetools import TTLCache
 from fastapi import FastAPI, HTTPException, Request, Depends, Body, BackgroundTasks
-from fastapi.responses import JSONResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import ORJSONResponse
 from fastapi.security import APIKeyHeader
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, select, insert, update, bindparam
 from sqlalchemy.orm import sessionmaker, Session
+from pydantic import ValidationError
 
 from config import (
     DATABASE_URL,
@@ -35,20 +53,64 @@ from schema import (
     RegisterPaybillResponse,
     UpdatePaybillRequest,
     STKPushPayload,
+    STK_BATCH_ADAPTER,
     RegisterUrlPayload,
 )
-from utils import get_base_url, authenticator, get_timestamp, generate_password
+from utils import ASYNC_CLIENT, get_base_url, authenticator, auth_headers, get_timestamp, generate_password
 from query import query_transaction_status
+from batching import BatchWriter
 
 # Engine and session
 if DATABASE_URL and DATABASE_URL.startswith("sqlite"):
     engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        """WAL lets readers run alongside the writer; synchronous=NORMAL skips the fsync on every commit."""
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA mmap_size=268435456")
+        cursor.execute("PRAGMA cache_size=-65536")
+        cursor.close()
 else:
     engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# expire_on_commit=False: ids and Python-side defaults are populated on flush, so reading a row
+# back after commit does not need another SELECT.
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
 Base.metadata.create_all(bind=engine)
 
 
+# C2B confirmations and their enrichment updates are coalesced and written in bulk.
+_ENRICH_TRANSACTION = (
+    update(Transaction)
+    .where(Transaction.transaction_number == bindparam("b_transaction_number"))
+    .values(phone_number=bindparam("b_phone_number"), full_name=bindparam("b_full_name"))
+)
+
+
+def _write_paybill_batch(items: list) -> None:
+    """Flush queued ("insert", row) / ("update", params) items. Inserts run first so updates find their rows."""
+    inserts = [row for op, row in items if op == "insert"]
+    updates = [row for op, row in items if op == "update"]
+    with engine.begin() as conn:
+        if inserts:
+            conn.execute(insert(Transaction), inserts)
+        if updates:
+            conn.execute(_ENRICH_TRANSACTION, updates)
+
+
+def _write_stk_batch(rows: list) -> None:
+    with engine.begin() as conn:
+        conn.execute(insert(StkPushTransaction), rows)
+
+
+paybill_writer = BatchWriter("paybill_offline", _write_paybill_batch)
+# STK push rows are written in bulk too; /callbackurl flushes (and waits) if it cannot find its row yet.
+stk_writer = BatchWriter("stk_push_transactions", _write_stk_batch, batch_size=1000, interval=0.2)
+
+
 def get_db():
     db = SessionLocal()
     try:
@@ -59,6 +121,17 @@ def get_db():
 
 api_key_header = APIKeyHeader(name="X-API-Key", auto_error=False)
 
+# Detached snapshots of App / Credential rows for the per-request auth lookups.
+# Entries expire after 60 s and are dropped as soon as the row is updated through the API.
+APP_CACHE = TTLCache(maxsize=10_000, ttl=60)
+CREDENTIAL_CACHE = TTLCache(maxsize=10_000, ttl=60)
+_CACHE_LOCK = threading.Lock()
+
+
+def _snapshot(row) -> SimpleNamespace:
+    """Copy a row's column values into a plain object that is safe to share across sessions."""
+    return SimpleNamespace(**{c.key: getattr(row, c.key) for c in row.__table__.columns})
+
 
 def get_app_from_header(
     request: Request,
@@ -69,17 +142,29 @@ def get_app_from_header(
     api_key = x_api_key or (request.headers.get("Authorization") or "").replace("Bearer ", "").strip()
     if not api_key:
         raise HTTPException(status_code=401, detail="Missing X-API-Key header")
-    app = db.query(App).filter(App.api_key == api_key).first()
-    if not app:
-        raise HTTPException(status_code=401, detail="Invalid API key")
+    with _CACHE_LOCK:
+        app = APP_CACHE.get(api_key)
+    if app is None:
+        row = db.query(App).filter(App.api_key == api_key).first()
+        if not row:
+            raise HTTPException(status_code=401, detail="Invalid API key")
+        app = _snapshot(row)
+        with _CACHE_LOCK:
+            APP_CACHE[api_key] = app
     return app
 
 
 def get_credential_for_app(app: App, credential_id: str, db: Session) -> Credential:
     """Get credential by credential_id and verify it belongs to the app."""
-    cred = db.query(Credential).filter(Credential.credential_id == credential_id).first()
-    if not cred:
-        raise HTTPException(status_code=404, detail="Credential not found")
+    with _CACHE_LOCK:
+        cred = CREDENTIAL_CACHE.get(credential_id)
+    if cred is None:
+        row = db.query(Credential).filter(Credential.credential_id == credential_id).first()
+        if not row:
+            raise HTTPException(status_code=404, detail="Credential not found")
+        cred = _snapshot(row)
+        with _CACHE_LOCK:
+            CREDENTIAL_CACHE[credential_id] = cred
     if cred.app_id != app.id:
         raise HTTPException(status_code=403, detail="Credential does not belong to this app")
     if not cred.is_active:
@@ -91,12 +176,26 @@ app = FastAPI(
     title="M-Pesa Credential Sharing API",
     description="Register apps, add paybills, and use M-Pesa APIs. **Authenticate:** Click **Authorize** (lock icon) and enter your `api_key`.",
     swagger_ui_parameters={"persistAuthorization": True},
+    default_response_class=ORJSONResponse,
 )
 
 
+@app.on_event("startup")
+async def start_batch_writers():
+    paybill_writer.start()
+    stk_writer.start()
+
+
+@app.on_event("shutdown")
+async def stop_batch_writers():
+    await paybill_writer.stop()
+    await stk_writer.stop()
+    await ASYNC_CLIENT.aclose()
+
+
 @app.exception_handler(ValueError)
 def value_error_handler(request, exc):
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=400,
         content={"detail": str(exc)},
     )
@@ -112,7 +211,6 @@ def register_app(payload: RegisterAppRequest, db: Session = Depends(get_db)):
     row = App(name=payload.name, account_number=account_number, api_key=api_key, callback_url=payload.callback_url)
     db.add(row)
     db.commit()
-    db.refresh(row)
     return row
 
 
@@ -123,11 +221,13 @@ def update_app(
     app: App = Depends(get_app_from_header),
 ):
     """Update the authenticated app. Only provided fields are updated."""
+    row = db.get(App, app.id)
     for key, value in payload.model_dump(exclude_unset=True).items():
-        setattr(app, key, value)
+        setattr(row, key, value)
     db.commit()
-    db.refresh(app)
-    return app
+    with _CACHE_LOCK:
+        APP_CACHE.pop(row.api_key, None)
+    return row
 
 
 # --- Paybill registration ---
@@ -150,19 +250,11 @@ def register_paybill(
         passkey=payload.passkey,
         initiator_name=payload.initiator_name,
         security_credential=payload.security_credential,
-        environment=payload.environment or "production",
+        environment=payload.environment,
     )
     db.add(row)
     db.commit()
-    db.refresh(row)
-    return RegisterPaybillResponse(
-        credential_id=row.credential_id,
-        name=row.name,
-        business_short_code=row.business_short_code,
-        environment=row.environment,
-        created_at=row.created_at,
-        updated_at=row.updated_at,
-    )
+    return RegisterPaybillResponse.model_validate(row)
 
 
 @app.get("/paybills", response_model=List[RegisterPaybillResponse])
@@ -172,17 +264,7 @@ def list_paybills(
 ):
     """List all paybills for the app."""
     rows = db.query(Credential).filter(Credential.app_id == app.id).all()
-    return [
-        RegisterPaybillResponse(
-            credential_id=r.credential_id,
-            name=r.name,
-            business_short_code=r.business_short_code,
-            environment=r.environment,
-            created_at=r.created_at,
-            updated_at=r.updated_at,
-        )
-        for r in rows
-    ]
+    return [RegisterPaybillResponse.model_validate(r) for r in rows]
 
 
 @app.patch("/paybills/{credential_id}", response_model=RegisterPaybillResponse)
@@ -193,42 +275,44 @@ def update_paybill(
     app: App = Depends(get_app_from_header),
 ):
     """Update an existing paybill. Only provided fields are updated."""
-    cred = get_credential_for_app(app, credential_id, db)
+    cred = db.get(Credential, get_credential_for_app(app, credential_id, db).id)
     for key, value in payload.model_dump(exclude_unset=True).items():
         setattr(cred, key, value)
     db.commit()
-    db.refresh(cred)
-    return RegisterPaybillResponse(
-        credential_id=cred.credential_id,
-        name=cred.name,
-        business_short_code=cred.business_short_code,
-        environment=cred.environment,
-        created_at=cred.created_at,
-        updated_at=cred.updated_at,
-    )
+    with _CACHE_LOCK:
+        CREDENTIAL_CACHE.pop(credential_id, None)
+    return RegisterPaybillResponse.model_validate(cred)
 
 
 # --- STK Push ---
 
-@app.post("/stkpush")
-def stk_push(
-    payload: STKPushPayload,
-    db: Session = Depends(get_db),
-    app: App = Depends(get_app_from_header),
-):
-    phone_number = payload.phoneNumber
-    account_number = payload.accountNumber
-    amount = payload.amount
+NAIROBI_TZ = ZoneInfo("Africa/Nairobi")
+# Outbound request bodies are pre-serialized with orjson, so the content type is set explicitly.
+_JSON_HEADERS = {"Content-Type": "application/json"}
+# STK push and URL registration keep the 30 s read budget they had before the client-wide 10 s default:
+# Safaricom may still act on a request we stopped waiting for (the customer gets prompted, we record nothing).
+_SAFARICOM_POST_TIMEOUT = httpx.Timeout(30.0, connect=3.05)
+# Concurrent outbound pushes per /stkpush/batch request; keeps one batch from draining the shared pool.
+STK_BATCH_CONCURRENCY = 20
 
+
+async def _resolve_stk_credential(app: App, credential_id: str, db: Session) -> Credential:
     # Step 1: Resolve credential
     try:
-        cred = get_credential_for_app(app, payload.credential_id, db)
+        return await run_in_threadpool(get_credential_for_app, app, credential_id, db)
     except HTTPException:
         raise
     except Exception as e:
         logger.exception("STK Push step 1 failed: credential lookup")
         raise HTTPException(status_code=500, detail=f"Credential lookup failed: {str(e)}")
 
+
+async def _send_stk_push(payload: STKPushPayload, cred: Credential) -> dict:
+    """Steps 2-4 of an STK push for an already resolved credential. Raises HTTPException on failure."""
+    phone_number = payload.phoneNumber
+    account_number = payload.accountNumber
+    amount = payload.amount
+
     base_url = get_base_url(cred.environment)
     logger.info(
         "STK Push request: credential_id=%s, phone=%s, amount=%s, shortcode=%s, env=%s",
@@ -241,7 +325,7 @@ def stk_push(
 
     # Step 2: Get OAuth token
     try:
-        token = authenticator(cred.consumer_key, cred.consumer_secret, base_url)
+        token = await authenticator(cred.consumer_key, cred.consumer_secret, base_url)
     except ValueError as e:
         logger.error("STK Push step 2 failed: OAuth token. %s", str(e))
         raise HTTPException(status_code=400, detail=f"OAuth failed: {str(e)}")
@@ -251,11 +335,12 @@ def stk_push(
 
     # Step 3: Call Safaricom STK Push API
     url = f"{base_url}mpesa/stkpush/v1/processrequest"
-    headers = {"Content-Type": "application/json", "Authorization": f"Bearer {token}"}
+    headers = auth_headers(token)
+    timestamp = get_timestamp()
     body = {
         "BusinessShortCode": cred.business_short_code,
-        "Password": generate_password(cred.business_short_code, cred.passkey),
-        "Timestamp": get_timestamp(),
+        "Password": generate_password(cred.business_short_code, cred.passkey, timestamp),
+        "Timestamp": timestamp,
         "TransactionType": "CustomerPayBillOnline",
         "Amount": amount,
         "PartyA": phone_number,
@@ -267,8 +352,10 @@ def stk_push(
     }
 
     try:
-        response = requests.post(url, json=body, headers=headers)
-    except requests.exceptions.RequestException as e:
+        response = await ASYNC_CLIENT.post(
+            url, content=orjson.dumps(body), headers=headers, timeout=_SAFARICOM_POST_TIMEOUT
+        )
+    except httpx.HTTPError as e:
         logger.exception("STK Push step 3 failed: network error calling Safaricom API")
         raise HTTPException(
             status_code=502,
@@ -338,22 +425,15 @@ def stk_push(
             detail=f"Safaricom error (ResponseCode {resp_code}): {resp_desc}. CustomerMessage: {customer_msg}",
         )
 
-    # Step 4: Save transaction to DB
-    try:
-        transaction = StkPushTransaction(
-            credential_id=cred.id,
-            merchant_request_id=r["MerchantRequestID"],
-            checkout_request_id=r["CheckoutRequestID"],
-            phone_number=phone_number,
-            amount=float(amount),
-            account_reference=account_number,
-        )
-        db.add(transaction)
-        db.commit()
-        db.refresh(transaction)
-    except Exception as e:
-        logger.exception("STK Push step 4 failed: database save")
-        raise HTTPException(status_code=500, detail=f"Failed to save transaction: {str(e)}")
+    # Step 4: Queue transaction for the batched DB insert
+    stk_writer.put({
+        "credential_id": cred.id,
+        "merchant_request_id": r["MerchantRequestID"],
+        "checkout_request_id": r["CheckoutRequestID"],
+        "phone_number": phone_number,
+        "amount": float(amount),
+        "account_reference": account_number,
+    })
 
     logger.info(
         "STK Push success: MerchantRequestID=%s, CheckoutRequestID=%s",
@@ -363,35 +443,111 @@ def stk_push(
     return r
 
 
+@app.post("/stkpush")
+async def stk_push(
+    payload: STKPushPayload,
+    db: Session = Depends(get_db),
+    app: App = Depends(get_app_from_header),
+):
+    cred = await _resolve_stk_credential(app, payload.credential_id, db)
+    return await _send_stk_push(payload, cred)
+
+
+# The batch body is validated by hand from the raw request, so document it for OpenAPI/Swagger explicitly.
+# STKPushPayload itself is already in components/schemas through /stkpush.
+_STK_BATCH_BODY_SCHEMA = {
+    key: value
+    for key, value in STK_BATCH_ADAPTER.json_schema(ref_template="#/components/schemas/{model}").items()
+    if key != "$defs"
+}
+
+
+@app.post(
+    "/stkpush/batch",
+    openapi_extra={
+        "requestBody": {"required": True, "content": {"application/json": {"schema": _STK_BATCH_BODY_SCHEMA}}}
+    },
+)
+async def stk_push_batch(
+    request: Request,
+    db: Session = Depends(get_db),
+    app: App = Depends(get_app_from_header),
+):
+    """
+    Initiate several STK pushes in one request. Body is a JSON list of /stkpush payloads.
+    Longer lists than schema.STK_BATCH_MAX_ITEMS get a 422; pushes go out STK_BATCH_CONCURRENCY at a time.
+    Returns one result per item, in order; failed items are {"status_code", "detail"}.
+    """
+    try:
+        payloads = STK_BATCH_ADAPTER.validate_json(await request.body())
+    except ValidationError as e:
+        # Same error shape as FastAPI's own body validation.
+        raise RequestValidationError(
+            [{**error, "loc": ("body", *error["loc"])} for error in e.errors(include_url=False)]
+        )
+
+    # Credentials are resolved one at a time because they share this request's DB session.
+    creds = []
+    for payload in payloads:
+        try:
+            creds.append(await _resolve_stk_credential(app, payload.credential_id, db))
+        except HTTPException as e:
+            creds.append(e)
+
+    semaphore = asyncio.Semaphore(STK_BATCH_CONCURRENCY)
+
+    async def _one(payload: STKPushPayload, cred) -> dict:
+        if isinstance(cred, HTTPException):
+            return {"status_code": cred.status_code, "detail": cred.detail}
+        async with semaphore:
+            try:
+                return await _send_stk_push(payload, cred)
+            except HTTPException as e:
+                return {"status_code": e.status_code, "detail": e.detail}
+            except Exception as e:
+                # Other pushes in the batch may already have been sent; never fail the whole response.
+                logger.exception("STK Push batch item failed")
+                return {"status_code": 500, "detail": f"STK Push failed: {str(e)}"}
+
+    return await asyncio.gather(*(_one(payload, cred) for payload, cred in zip(payloads, creds)))
+
+
 @app.post("/callbackurl")
-async def mpesa_callback(request: Request, db: Session = Depends(get_db)):
-    print("callback has been hit")
+async def mpesa_callback(request: Request):
     """STK Push callback. Credential resolved from MerchantRequestID+CheckoutRequestID -> StkPushTransaction."""
-    raw = await request.json()
-    print("raw callback data", raw)
+    raw = orjson.loads(await request.body())
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Raw STK callback: %s", raw)
     callback_data = raw.get("Body", {}).get("stkCallback") or raw
     if not isinstance(callback_data, dict):
         raise HTTPException(status_code=400, detail="Invalid callback structure")
     mid = callback_data.get("MerchantRequestID")
     cid = callback_data.get("CheckoutRequestID")
-    print("callback", callback_data)
+    logger.info(
+        "STK callback: MerchantRequestID=%s, CheckoutRequestID=%s, ResultCode=%s",
+        mid,
+        cid,
+        callback_data.get("ResultCode"),
+    )
     if not mid or not cid:
         raise HTTPException(status_code=400, detail="Missing MerchantRequestID or CheckoutRequestID")
-    transaction = (
-        db.query(StkPushTransaction)
-        .filter(StkPushTransaction.merchant_request_id == mid, StkPushTransaction.checkout_request_id == cid)
-        .first()
-    )
-    print("transaction", transaction)
-    if not transaction:
-        raise HTTPException(status_code=404, detail="Transaction not found")
-    transaction.status = "Done"
-    transaction.result_code = callback_data.get("ResultCode")
-    transaction.result_desc = callback_data.get("ResultDesc")
-    kenya_tz = pytz.timezone("Africa/Nairobi")
-    transaction.updated_at = datetime.now(pytz.utc).astimezone(kenya_tz)
-    db.commit()
-    db.refresh(transaction)
+    # Session opened only once the payload is known to be usable.
+    with SessionLocal() as db:
+        stk_query = db.query(StkPushTransaction).filter(
+            StkPushTransaction.merchant_request_id == mid, StkPushTransaction.checkout_request_id == cid
+        )
+        transaction = stk_query.first()
+        if not transaction:
+            # The row may still be waiting in the STK batch: write it out and look again.
+            await stk_writer.flush()
+            transaction = stk_query.first()
+        if not transaction:
+            raise HTTPException(status_code=404, detail="Transaction not found")
+        transaction.status = "Done"
+        transaction.result_code = callback_data.get("ResultCode")
+        transaction.result_desc = callback_data.get("ResultDesc")
+        transaction.updated_at = datetime.now(NAIROBI_TZ)
+        db.commit()
     return {"status": "success", "message": "Callback received successfully"}
 
 
@@ -402,105 +558,193 @@ async def mpesa_callback(request: Request, db: Session = Depends(get_db)):
     tags=["C2B"],
     summary="Register validation and confirmation URLs on M-Pesa",
 )
-def register_url(
+async def register_url(
     payload: RegisterUrlPayload,
     db: Session = Depends(get_db),
     app: App = Depends(get_app_from_header),
 ):
-    cred = get_credential_for_app(app, payload.credential_id, db)
+    cred = await run_in_threadpool(get_credential_for_app, app, payload.credential_id, db)
     base_url = get_base_url(cred.environment)
-    token = authenticator(cred.consumer_key, cred.consumer_secret, base_url)
+    token = await authenticator(cred.consumer_key, cred.consumer_secret, base_url)
     url = f"{base_url}mpesa/c2b/v2/registerurl"
-    headers = {"Content-Type": "application/json", "Authorization": f"Bearer {token}"}
+    headers = auth_headers(token)
     body = {
         "ShortCode": cred.business_short_code,
         "ResponseType": "Completed",
         "ConfirmationURL": payload.ConfirmationURL or CALLBACK_URL_CONFIRMATION,
         "ValidationURL": payload.ValidationURL or CALLBACK_URL_VALIDATION,
     }
-    r = requests.post(url, json=body, headers=headers).json()
+    r = (
+        await ASYNC_CLIENT.post(url, content=orjson.dumps(body), headers=headers, timeout=_SAFARICOM_POST_TIMEOUT)
+    ).json()
     return r
 
 
 @app.post("/validationurl", tags=["C2B"])
-async def validation_url(request: Request, db: Session = Depends(get_db)):
-    body = await request.json()
+async def validation_url(request: Request):
+    body = orjson.loads(await request.body())
     shortcode = str(body.get("BusinessShortCode") or body.get("ShortCode") or "")
     if shortcode:
-        cred = db.query(Credential).filter(Credential.business_short_code == shortcode).first()
+        with SessionLocal() as db:
+            cred = db.query(Credential).filter(Credential.business_short_code == shortcode).first()
         if cred and not cred.is_active:
             pass
     return {"ResultCode": 0, "ResultDesc": "Accepted"}
 
 
-def _forward_to_app_callback(callback_url: str, body: dict) -> None:
-    """Forward Safaricom confirmation payload to app's callback_url. Runs in background."""
+# Callback URLs that recently failed: url -> (consecutive failures, monotonic time to retry after).
+_UNREACHABLE_CALLBACKS: "OrderedDict[str, tuple[int, float]]" = OrderedDict()
+_UNREACHABLE_MAX_SIZE = 1024
+_FORWARD_BACKOFF_BASE = 5
+_FORWARD_BACKOFF_MAX = 300
+# How long a confirmation forward keeps waiting on a backing-off URL, and how many may wait at once.
+_FORWARD_RETRY_FOR = 3600
+_MAX_DEFERRED_FORWARDS = 10_000
+_deferred_forwards = 0
+
+# Strong references to fire-and-forget tasks so they are not garbage collected mid-flight.
+_background_tasks: set = set()
+
+
+def _spawn(coro) -> None:
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+def _mark_callback_unreachable(callback_url: str, failures: int) -> None:
+    delay = min(_FORWARD_BACKOFF_BASE * 2 ** (failures - 1), _FORWARD_BACKOFF_MAX)
+    _UNREACHABLE_CALLBACKS[callback_url] = (failures, time.monotonic() + delay)
+    _UNREACHABLE_CALLBACKS.move_to_end(callback_url)
+    if len(_UNREACHABLE_CALLBACKS) > _UNREACHABLE_MAX_SIZE:
+        _UNREACHABLE_CALLBACKS.popitem(last=False)
+
+
+async def _forward_to_app_callback(callback_url: str, body: dict) -> None:
+    """
+    Forward Safaricom confirmation payload to app's callback_url. While the URL is backing off after
+    failures the forward waits and is retried when the backoff expires, for up to _FORWARD_RETRY_FOR
+    seconds; a forward that is finally given up on is logged at ERROR with its TransID for replay.
+    """
+    global _deferred_forwards
+    trans_id = body.get("TransID")
+    give_up_at = time.monotonic() + _FORWARD_RETRY_FOR
+    deferred = False
     try:
-        requests.post(callback_url, json=body, timeout=30)
+        while True:
+            backoff = _UNREACHABLE_CALLBACKS.get(callback_url)
+            now = time.monotonic()
+            if backoff and now < backoff[1]:
+                if backoff[1] > give_up_at or (not deferred and _deferred_forwards >= _MAX_DEFERRED_FORWARDS):
+                    logger.error(
+                        "Giving up forwarding TransID=%s to app callback %s: unreachable", trans_id, callback_url
+                    )
+                    return
+                if not deferred:
+                    deferred = True
+                    _deferred_forwards += 1
+                    logger.warning(
+                        "Deferring forward of TransID=%s to app callback %s: backing off", trans_id, callback_url
+                    )
+                await asyncio.sleep(backoff[1] - now)
+                continue
+            try:
+                await ASYNC_CLIENT.post(callback_url, content=orjson.dumps(body), headers=_JSON_HEADERS, timeout=30)
+            except Exception as e:
+                logger.warning("Failed to forward TransID=%s to app callback %s: %s", trans_id, callback_url, e)
+                # Forwards retried together after one backoff count as a single failure.
+                if _UNREACHABLE_CALLBACKS.get(callback_url) == backoff:
+                    _mark_callback_unreachable(callback_url, (backoff[0] if backoff else 0) + 1)
+                continue
+            _UNREACHABLE_CALLBACKS.pop(callback_url, None)
+            return
+    except asyncio.CancelledError:
+        logger.error("Forward of TransID=%s to app callback %s cancelled before delivery", trans_id, callback_url)
+        raise
+    finally:
+        if deferred:
+            _deferred_forwards -= 1
+
+
+async def _query_status_in_background(cred, transaction_id: str) -> None:
+    try:
+        await query_transaction_status(cred, transaction_id, CALLBACK_URL_RESULT, CALLBACK_URL_TIMEOUT)
     except Exception as e:
-        logger.warning("Failed to forward to app callback %s: %s", callback_url, e)
+        logger.warning("Transaction status query failed for %s: %s", transaction_id, e)
+
+
+# Credential fields needed to record a confirmation and query its status.
+_TENANT_COLUMNS = (
+    Credential.id,
+    Credential.consumer_key,
+    Credential.consumer_secret,
+    Credential.business_short_code,
+    Credential.initiator_name,
+    Credential.security_credential,
+    Credential.environment,
+)
 
 
 @app.post("/confirmationurl", tags=["C2B"])
 async def confirmation_url(request: Request, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
-    body = await request.json()
+    body = orjson.loads(await request.body())
     shortcode = str(body.get("BusinessShortCode") or body.get("ShortCode") or "")
-    cred = db.query(Credential).filter(Credential.business_short_code == shortcode).first()
+    # Forward to app callback: first 3 chars of BillRefNumber = account_number
+    bill_ref = str(body.get("BillRefNumber") or "")
+    account_number = bill_ref[:3].lower() if len(bill_ref) >= 3 else None
+    # One round trip: the credential for the shortcode plus the callback_url of the app named by the bill ref.
+    cred = db.execute(
+        select(*_TENANT_COLUMNS, App.callback_url)
+        .select_from(Credential)
+        .outerjoin(App, App.account_number == account_number)
+        .where(Credential.business_short_code == shortcode)
+    ).first()
     if not cred:
         return {"ResultCode": 0, "ResultDesc": "Accepted"}
     try:
-        trans_amount = float(body.get("TransAmount", 0))
-        txn = Transaction(
-            credential_id=cred.id,
-            transaction_number=body.get("TransID", ""),
-            trans_amount=trans_amount,
-            first_name=body.get("FirstName", ""),
-            trans_time=str(body.get("TransTime", "")),
-            account_reference=body.get("BillRefNumber", ""),
-            paybill_no=shortcode,
-        )
-        db.add(txn)
-        db.commit()
-        db.refresh(txn)
-    except Exception:
-        pass
-    try:
-        query_transaction_status(cred, body.get("TransID", ""), CALLBACK_URL_RESULT, CALLBACK_URL_TIMEOUT)
+        trans_amount = float(body.get("TransAmount") or 0)
+        # `or` rather than a get() default: an explicit null would otherwise break the NOT NULL columns.
+        paybill_writer.put((
+            "insert",
+            {
+                "credential_id": cred.id,
+                "transaction_number": body.get("TransID") or "",
+                "trans_amount": trans_amount,
+                "first_name": body.get("FirstName") or "",
+                "trans_time": str(body.get("TransTime") or ""),
+                "account_reference": body.get("BillRefNumber") or "",
+                "paybill_no": shortcode,
+            },
+        ))
     except Exception:
         pass
-    # Forward to app callback: first 3 chars of BillRefNumber = account_number
-    bill_ref = str(body.get("BillRefNumber", ""))
-    if len(bill_ref) >= 3:
-        account_number = bill_ref[:3].lower()
-        app = db.query(App).filter(App.account_number == account_number).first()
-        if app and app.callback_url:
-            background_tasks.add_task(_forward_to_app_callback, app.callback_url, body)
+    # Status query runs after the ack is sent; its result arrives later on /resulturl.
+    background_tasks.add_task(_query_status_in_background, cred, body.get("TransID", ""))
+    if cred.callback_url:
+        _spawn(_forward_to_app_callback(cred.callback_url, body))
     return {"ResultCode": 0, "ResultDesc": "Accepted"}
 
 
 @app.post("/resulturl", tags=["C2B"])
-async def result_url(request: Request, db: Session = Depends(get_db)):
-    body = await request.json()
+async def result_url(request: Request):
+    body = orjson.loads(await request.body())
     res = body.get("Result") or {}
     if res.get("ResultCode") != 0:
         return {"ResultCode": 0, "ResultDesc": "Accepted"}
     params = (res.get("ResultParameters") or {}).get("ResultParameter") or []
-    receipt_no = None
-    debit_party = None
-    for p in params:
-        if isinstance(p, dict):
-            if p.get("Key") == "ReceiptNo":
-                receipt_no = p.get("Value")
-            elif p.get("Key") == "DebitPartyName":
-                debit_party = p.get("Value")
-    if receipt_no:
-        txn = db.query(Transaction).filter(Transaction.transaction_number == str(receipt_no)).first()
-        if txn and debit_party:
-            parts = str(debit_party).split(" - ", 1)
-            txn.phone_number = parts[0].strip() if parts else None
-            txn.full_name = parts[1].strip() if len(parts) > 1 else None
-            db.commit()
-            db.refresh(txn)
+    values = {p["Key"]: p.get("Value") for p in params if isinstance(p, dict) and "Key" in p}
+    receipt_no = values.get("ReceiptNo")
+    debit_party = values.get("DebitPartyName")
+    if receipt_no and debit_party:
+        parts = str(debit_party).split(" - ", 1)
+        paybill_writer.put((
+            "update",
+            {
+                "b_transaction_number": str(receipt_no),
+                "b_phone_number": parts[0].strip() if parts else None,
+                "b_full_name": parts[1].strip() if len(parts) > 1 else None,
+            },
+        ))
     return {"ResultCode": 0, "ResultDesc": "Accepted"}
 
 
@@ -511,6 +755,27 @@ async def timeout_url(request: Request):
 
 # --- Read APIs ---
 
+# Columns returned by the transaction read endpoints, selected directly to skip ORM hydration.
+_TRANSACTION_COLUMNS = (
+    Transaction.id,
+    Transaction.account_reference,
+    Transaction.transaction_number,
+    Transaction.trans_amount,
+    Transaction.first_name,
+    Transaction.phone_number,
+    Transaction.trans_time,
+    Transaction.full_name,
+    Transaction.paybill_no,
+)
+
+
+def _list_transactions(db: Session, app: App, credential_id: Optional[str], *criteria) -> List[Dict]:
+    stmt = select(*_TRANSACTION_COLUMNS).join(Credential).where(Credential.app_id == app.id, *criteria)
+    if credential_id:
+        stmt = stmt.where(Credential.credential_id == credential_id)
+    return [row._asdict() for row in db.execute(stmt)]
+
+
 @app.get("/transactions/{account_reference}", response_model=Dict[str, List[Dict]])
 def get_transactions_by_account_reference(
     account_reference: str,
@@ -518,28 +783,10 @@ def get_transactions_by_account_reference(
     db: Session = Depends(get_db),
     app: App = Depends(get_app_from_header),
 ):
-    q = db.query(Transaction).join(Credential).filter(
-        Transaction.account_reference == account_reference,
-        Credential.app_id == app.id,
-    )
-    if credential_id:
-        q = q.filter(Credential.credential_id == credential_id)
-    rows = q.all()
     return {
-        "transactions": [
-            {
-                "id": t.id,
-                "account_reference": t.account_reference,
-                "transaction_number": t.transaction_number,
-                "trans_amount": t.trans_amount,
-                "first_name": t.first_name,
-                "phone_number": t.phone_number,
-                "trans_time": t.trans_time,
-                "full_name": t.full_name,
-                "paybill_no": t.paybill_no,
-            }
-            for t in rows
-        ]
+        "transactions": _list_transactions(
+            db, app, credential_id, Transaction.account_reference == account_reference
+        )
     }
 
 
@@ -549,23 +796,4 @@ def get_transactions_all(
     db: Session = Depends(get_db),
     app: App = Depends(get_app_from_header),
 ):
-    q = db.query(Transaction).join(Credential).filter(Credential.app_id == app.id)
-    if credential_id:
-        q = q.filter(Credential.credential_id == credential_id)
-    rows = q.all()
-    return {
-        "transactions": [
-            {
-                "id": t.id,
-                "account_reference": t.account_reference,
-                "transaction_number": t.transaction_number,
-                "trans_amount": t.trans_amount,
-                "first_name": t.first_name,
-                "phone_number": t.phone_number,
-                "trans_time": t.trans_time,
-                "full_name": t.full_name,
-                "paybill_no": t.paybill_no,
-            }
-            for t in rows
-        ]
-    }
+    return {"transactions": _list_transactions(db, app, credential_id)}
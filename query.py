@@ -1,37 +1,81 @@
-import requests
+import asyncio
+import httpx
+import orjson
+from functools import lru_cache
 from fastapi import HTTPException
 
-from utils import get_base_url, authenticator
+from utils import BASE_URLS, get_base_url, authenticator, auth_headers, request_with_retry
 
+_TXN_STATUS_URLS = {base_url: f"{base_url}mpesa/transactionstatus/v1/query" for base_url in BASE_URLS.values()}
 
-def query_transaction_status(tenant, transaction_id: str, result_url: str, timeout_url: str):
-    """
-    Query M-Pesa transaction status. Uses tenant's initiator, security_credential, shortcode;
-    result_url and timeout_url are shared (from config).
-    """
-    base_url = get_base_url(tenant.environment)
-    url = f"{base_url}mpesa/transactionstatus/v1/query"
-    token = authenticator(tenant.consumer_key, tenant.consumer_secret, base_url)
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json",
-    }
-    payload = {
-        "Initiator": tenant.initiator_name,
-        "SecurityCredential": tenant.security_credential,
+
+@lru_cache(maxsize=1024)
+def _status_query_template(
+    initiator_name: str, security_credential: str, short_code: str, result_url: str, timeout_url: str
+) -> dict:
+    """Static part of the status query payload. Keyed by value, so a PATCHed credential gets a fresh entry."""
+    return {
+        "Initiator": initiator_name,
+        "SecurityCredential": security_credential,
         "CommandID": "TransactionStatusQuery",
-        "TransactionID": transaction_id,
-        "PartyA": tenant.business_short_code,
+        "PartyA": short_code,
         "IdentifierType": "4",
         "ResultURL": result_url,
         "QueueTimeOutURL": timeout_url,
         "Remarks": "Transaction status query",
         "Occasion": "Query",
     }
-    response = requests.post(url, headers=headers, json=payload)
-    if response.status_code == 200:
-        return response.json()
+
+
+async def _post_status_query(tenant, token: str, url: str, transaction_id: str, result_url: str, timeout_url: str):
+    payload = {
+        **_status_query_template(
+            tenant.initiator_name, tenant.security_credential, tenant.business_short_code, result_url, timeout_url
+        ),
+        "TransactionID": transaction_id,
+    }
+    response = await request_with_retry("POST", url, headers=auth_headers(token), content=orjson.dumps(payload))
+    status = response.status_code
+    if 200 <= status < 300:
+        if status == 204:
+            return {}
+        return orjson.loads(response.content)
+    # Cap the error body so a large failure page isn't decoded in full just for the detail.
     raise HTTPException(
-        status_code=response.status_code,
-        detail=f"Transaction status query failed: {response.text}",
+        status_code=status,
+        detail=f"Transaction status query failed: {response.content[:512].decode('utf-8', 'replace')}",
     )
+
+
+async def query_transaction_status(tenant, transaction_id: str, result_url: str, timeout_url: str):
+    """
+    Query M-Pesa transaction status. Uses tenant's initiator, security_credential, shortcode;
+    result_url and timeout_url are shared (from config).
+    """
+    base_url = get_base_url(tenant.environment)
+    url = _TXN_STATUS_URLS[base_url]
+    token = await authenticator(tenant.consumer_key, tenant.consumer_secret, base_url)
+    return await _post_status_query(tenant, token, url, transaction_id, result_url, timeout_url)
+
+
+async def query_many(tenant, transaction_ids: list, result_url: str, timeout_url: str, concurrency: int = 20) -> list:
+    """
+    Query the status of many transactions for one tenant concurrently, at most `concurrency` in flight.
+    Returns one entry per id in the same order; a failed query becomes
+    {"TransactionID": ..., "error": ...} instead of aborting the batch.
+    """
+    base_url = get_base_url(tenant.environment)
+    url = _TXN_STATUS_URLS[base_url]
+    token = await authenticator(tenant.consumer_key, tenant.consumer_secret, base_url)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def _one(transaction_id: str):
+        async with semaphore:
+            try:
+                return await _post_status_query(tenant, token, url, transaction_id, result_url, timeout_url)
+            except HTTPException as e:
+                return {"TransactionID": transaction_id, "error": e.detail}
+            except (httpx.HTTPError, ValueError) as e:
+                return {"TransactionID": transaction_id, "error": str(e)}
+
+    return await asyncio.gather(*(_one(transaction_id) for transaction_id in transaction_ids))
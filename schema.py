@@ -1,13 +1,32 @@
-from pydantic import BaseModel, Field
-from typing import Optional
+from pydantic import BaseModel, ConfigDict, Field, StringConstraints, TypeAdapter
+from typing import Annotated, Optional
+from dataclasses import dataclass
 from datetime import datetime
+from enum import Enum
+
+
+class Environment(str, Enum):
+    SANDBOX = "sandbox"
+    PRODUCTION = "production"
+
+    @classmethod
+    def _missing_(cls, value):
+        # Accept any casing ("Sandbox", "PRODUCTION"), as the API did before environment was an enum.
+        if isinstance(value, str):
+            return cls._value2member_map_.get(value.lower())
+        return None
+
+
+# Length-constrained strings, checked by pydantic-core's native str validator.
+NameStr = Annotated[str, StringConstraints(min_length=1, max_length=255)]
+CallbackUrlStr = Annotated[str, StringConstraints(min_length=1, max_length=512)]
 
 
 # --- App registration ---
 
 class RegisterAppRequest(BaseModel):
-    name: str = Field(..., min_length=1, max_length=255)
-    callback_url: str = Field(..., min_length=1, max_length=512)
+    name: NameStr
+    callback_url: CallbackUrlStr
 
 
 class RegisterAppResponse(BaseModel):
@@ -18,27 +37,29 @@ class RegisterAppResponse(BaseModel):
     created_at: datetime
     updated_at: datetime
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True, extra="ignore")
 
 
 class UpdateAppRequest(BaseModel):
     """All fields optional for partial update."""
-    name: Optional[str] = Field(None, min_length=1, max_length=255)
-    callback_url: Optional[str] = Field(None, min_length=1, max_length=512)
+    name: Optional[NameStr] = None
+    callback_url: Optional[CallbackUrlStr] = None
 
 
 # --- Paybill registration (same as old MpesaCredentialCreate except no api_key) ---
 
 class RegisterPaybillRequest(BaseModel):
-    name: str = Field(..., min_length=1, max_length=255)
+    # validate_default so an omitted environment is also converted to its plain string value.
+    model_config = ConfigDict(use_enum_values=True, validate_default=True)
+
+    name: NameStr
     consumer_key: str
     consumer_secret: str
     business_short_code: str
     passkey: str
     initiator_name: str
     security_credential: str
-    environment: str = "production"
+    environment: Environment = Environment.PRODUCTION
 
 
 class RegisterPaybillResponse(BaseModel):
@@ -49,26 +70,29 @@ class RegisterPaybillResponse(BaseModel):
     created_at: datetime
     updated_at: datetime
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True, extra="ignore")
 
 
 class UpdatePaybillRequest(BaseModel):
     """All fields optional for partial update."""
-    name: Optional[str] = Field(None, min_length=1, max_length=255)
+    model_config = ConfigDict(use_enum_values=True)
+
+    name: Optional[NameStr] = None
     consumer_key: Optional[str] = None
     consumer_secret: Optional[str] = None
     business_short_code: Optional[str] = None
     passkey: Optional[str] = None
     initiator_name: Optional[str] = None
     security_credential: Optional[str] = None
-    environment: Optional[str] = None
+    environment: Optional[Environment] = None
     is_active: Optional[bool] = None
 
 
 # --- STK Push (api_key in header, credential_id in body) ---
 
-class STKResponse(BaseModel):
+# Plain DTOs for M-Pesa responses we only structure, never validate; use dataclasses.asdict() to serialize.
+@dataclass(slots=True, frozen=True)
+class STKResponse:
     MerchantRequestID: str
     CheckoutRequestID: str
     ResponseCode: int
@@ -79,12 +103,20 @@ class STKResponse(BaseModel):
 class STKPushPayload(BaseModel):
     credential_id: str
     amount: int
-    phoneNumber: str = Field(..., min_length=1, max_length=12)
-    accountNumber: str = Field(..., min_length=1, max_length=12)
-    transactionDescription: Optional[str] = Field(None, min_length=1, max_length=13)
+    phoneNumber: Annotated[str, StringConstraints(min_length=1, max_length=12)]
+    accountNumber: Annotated[str, StringConstraints(min_length=1, max_length=12)]
+    transactionDescription: Optional[Annotated[str, StringConstraints(min_length=1, max_length=13)]] = None
+
+
+# Upper bound on /stkpush/batch list length, so one request cannot fan out an unbounded number of pushes.
+STK_BATCH_MAX_ITEMS = 100
+
+# Built once at import so /stkpush/batch validates the whole list in a single core-schema call.
+STK_BATCH_ADAPTER = TypeAdapter(Annotated[list[STKPushPayload], Field(min_length=1, max_length=STK_BATCH_MAX_ITEMS)])
 
 
-class MpesacallbackResponse(BaseModel):
+@dataclass(slots=True, frozen=True)
+class MpesacallbackResponse:
     MerchantRequestID: str
     CheckoutRequestID: str
     ResultCode: int
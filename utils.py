@@ -1,24 +1,71 @@
-import requests
-from requests.auth import HTTPBasicAuth
-from datetime import datetime
-import base64
+import asyncio
+import hashlib
+import httpx
+import logging
+import time
+from functools import lru_cache
+from typing import Optional
+from binascii import b2a_base64
+
+from schema import Environment
+
+logger = logging.getLogger(__name__)
+
+# Shared async client for every outbound call (Safaricom and tenant callbacks); closed on app shutdown.
+# max_connections bounds in-flight requests per worker; keep-alive connections are reused across calls.
+# The transport retries failed connection attempts only (nothing was sent), so it is safe for POSTs;
+# the explicit timeout keeps a stalled Safaricom connection from pinning a request forever.
+ASYNC_CLIENT = httpx.AsyncClient(
+    timeout=httpx.Timeout(10.0, connect=3.05),
+    transport=httpx.AsyncHTTPTransport(
+        retries=2,
+        limits=httpx.Limits(max_connections=200, max_keepalive_connections=50),
+    ),
+)
+
+# Gateway errors retried for idempotent Safaricom calls (OAuth, status queries). STK pushes are never retried.
+RETRY_STATUSES = frozenset({502, 503, 504})
+MAX_STATUS_RETRIES = 1
+RETRY_BACKOFF = 0.25
+
+# OAuth tokens keyed by (consumer_key, sha256(consumer_secret), base_url) -> (access_token, expires_at on
+# the monotonic clock). The secret is part of the key so a token is only served to callers holding both
+# credentials, and a changed secret is checked against Safaricom again.
+# Tokens are refreshed a minute before Safaricom's expires_in runs out; one lock per key so a
+# slow refresh for one credential does not hold up the others.
+_TOKEN_CACHE: dict[tuple[str, str, str], tuple[str, float]] = {}
+_TOKEN_LOCKS: dict[tuple[str, str, str], asyncio.Lock] = {}
+DEFAULT_TOKEN_TTL = 3599
+TOKEN_REFRESH_MARGIN = 60
+
+
+async def request_with_retry(method: str, url: str, **kwargs) -> httpx.Response:
+    """Send a request through ASYNC_CLIENT, retrying 502/503/504 responses with exponential backoff."""
+    for attempt in range(MAX_STATUS_RETRIES + 1):
+        response = await ASYNC_CLIENT.request(method, url, **kwargs)
+        if response.status_code not in RETRY_STATUSES or attempt == MAX_STATUS_RETRIES:
+            return response
+        await asyncio.sleep(RETRY_BACKOFF * 2 ** attempt)
+
+
+BASE_URLS = {
+    Environment.SANDBOX.value: "https://sandbox.safaricom.co.ke/",
+    Environment.PRODUCTION.value: "https://api.safaricom.co.ke/",
+}
 
 
 def get_base_url(environment: str) -> str:
-    if (environment or "").lower() == "sandbox":
-        return "https://sandbox.safaricom.co.ke/"
-    return "https://api.safaricom.co.ke/"
+    try:
+        return BASE_URLS[environment]
+    except KeyError:
+        # Rows saved before environment was validated may use other spellings; anything but sandbox is production.
+        return BASE_URLS.get((environment or "").lower(), BASE_URLS[Environment.PRODUCTION.value])
 
 
-def authenticator(consumer_key: str, consumer_secret: str, base_url: str) -> str:
-    print("Am Hereeee")
-    print("cons_key", consumer_key)
-    print("cons_sec", consumer_secret)
-    base_url="https://api.safaricom.co.ke/"
+async def _fetch_token(consumer_key: str, consumer_secret: str, base_url: str) -> tuple[str, int]:
+    """Request a new OAuth token from Safaricom. Returns (access_token, expires_in seconds)."""
     url = f"{base_url}oauth/v1/generate?grant_type=client_credentials"
-    r = requests.get(url, auth=HTTPBasicAuth(consumer_key, consumer_secret))
-    i=r.json()
-    print("JJJ", i)
+    r = await request_with_retry("GET", url, auth=(consumer_key, consumer_secret))
     if r.status_code != 200:
         raise ValueError(
             f"M-Pesa OAuth failed (status {r.status_code}). "
@@ -34,13 +81,69 @@ def authenticator(consumer_key: str, consumer_secret: str, base_url: str) -> str
         raise ValueError(
             f"M-Pesa OAuth response missing access_token. Response: {data}"
         )
-    return data["access_token"]
+    try:
+        expires_in = int(data.get("expires_in", DEFAULT_TOKEN_TTL))
+    except (TypeError, ValueError):
+        expires_in = DEFAULT_TOKEN_TTL
+    logger.debug("OAuth OK for %s", consumer_key[:6])
+    return data["access_token"], expires_in
+
+
+async def authenticator(consumer_key: str, consumer_secret: str, base_url: str) -> str:
+    """
+    Return an OAuth access token for the credential. Tokens are cached per (consumer_key, consumer_secret,
+    base_url) and only refetched when they are about to expire; concurrent callers wait for a single refresh.
+    """
+    key = (consumer_key, hashlib.sha256(consumer_secret.encode()).hexdigest(), base_url)
+    cached = _TOKEN_CACHE.get(key)
+    if cached and cached[1] - time.monotonic() > TOKEN_REFRESH_MARGIN:
+        return cached[0]
+    async with _TOKEN_LOCKS.setdefault(key, asyncio.Lock()):
+        cached = _TOKEN_CACHE.get(key)
+        if cached and cached[1] - time.monotonic() > TOKEN_REFRESH_MARGIN:
+            return cached[0]
+        token, expires_in = await _fetch_token(consumer_key, consumer_secret, base_url)
+        _TOKEN_CACHE[key] = (token, time.monotonic() + expires_in)
+    return token
+
+
+@lru_cache(maxsize=1024)
+def auth_headers(token: str) -> dict:
+    """
+    JSON request headers for a bearer token. Tokens rotate about hourly, so the dict is built once per
+    token and shared between calls; treat it as read-only (httpx copies it into each request).
+    """
+    return {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+
+
+# (epoch second, formatted timestamp) of the last get_timestamp() call.
+_TS_CACHE: tuple[int, str] = (0, "")
 
 
 def get_timestamp() -> str:
-    return datetime.now().strftime("%Y%m%d%H%M%S")
+    # Local time, as before. The string has one-second resolution, so reformat only when the second changes.
+    global _TS_CACHE
+    now = int(time.time())
+    if now == _TS_CACHE[0]:
+        return _TS_CACHE[1]
+    timestamp = time.strftime("%Y%m%d%H%M%S", time.localtime(now))
+    _TS_CACHE = (now, timestamp)
+    return timestamp
+
+
+@lru_cache(maxsize=4096)
+def _password_prefix(business_short_code: str, passkey: str) -> bytes:
+    return (business_short_code + passkey).encode()
+
+
+@lru_cache(maxsize=1024)
+def _stk_password(business_short_code: str, passkey: str, timestamp: str) -> str:
+    return b2a_base64(_password_prefix(business_short_code, passkey) + timestamp.encode("ascii"), newline=False).decode("ascii")
 
 
-def generate_password(business_short_code: str, passkey: str) -> str:
-    password_to_encrypt = business_short_code + passkey + get_timestamp()
-    return base64.b64encode(password_to_encrypt.encode()).decode("utf-8")
+def generate_password(business_short_code: str, passkey: str, timestamp: Optional[str] = None) -> str:
+    """
+    STK push password. The timestamp has one-second resolution, so the result is memoized per
+    (shortcode, passkey, timestamp). Pass the same timestamp that goes into the request body.
+    """
+    return _stk_password(business_short_code, passkey, timestamp or get_timestamp())